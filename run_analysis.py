@@ -5,17 +5,54 @@ Usage: python run_analysis.py [--input FILE] [--output DIR] [--format json|md|ht
 """
 
 import argparse
-import json
+import multiprocessing
+import os
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from tqdm import tqdm
-import pandas as pd
+import orjson
 
-from src.pattern_detector import JailbreakPatternAnalyzer
+from src.pattern_detector import get_analyzer
 from src.risk_scorer import RiskScorer
 from src.visualization import JailbreakVisualizer
 
+def _analyze_one(prompt: str) -> dict:
+    """Analyze one prompt (runs inside a pool worker)"""
+    return get_analyzer().analyze_prompt(prompt)
+
+def _stream(prompts: list, prompt_keys: list, unique_keys: list, results, verbose: bool = False):
+    """
+    Expand analyses of unique_keys back into prompt order as they arrive.
+    
+    A prompt's first occurrence never comes after it in unique_keys, so
+    results are pulled only as far as needed. Repeats get their own copy
+    because batch_analyze attaches per-prompt metadata. An analysis is
+    dropped after its last occurrence, so only prompts that will repeat
+    stay in memory.
+    """
+    unique_results = zip(unique_keys, results)
+    remaining = Counter(prompt_keys)
+    analyses = {}
+    for prompt_data, key in zip(prompts, prompt_keys):
+        if key in analyses:
+            analysis = dict(analyses[key])
+        else:
+            while key not in analyses:
+                done_key, done_analysis = next(unique_results)
+                analyses[done_key] = done_analysis
+            analysis = analyses[key]
+        remaining[key] -= 1
+        if not remaining[key]:
+            del analyses[key]
+        
+        # Report high-risk prompts as soon as each analysis arrives
+        if verbose and analysis['risk_score'] > 70:
+            tqdm.write(f"⚠️  High risk detected (ID {prompt_data.get('id')}): Score {analysis['risk_score']}")
+        yield analysis
+
 def main():
     parser = argparse.ArgumentParser(description='Analyze prompts for jailbreak patterns')
     parser.add_argument('--input', '-i', default='data/jailbreak_attempts.json',
@@ -26,6 +63,12 @@ def main():
                        default='all', help='Output format')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Verbose output')
+    parser.add_argument('--stream-details', action='store_true',
+                       help='Write per-prompt analyses to a JSONL file as they finish '
+                            'instead of keeping them in memory and in the JSON results')
+    parser.add_argument('--plotlyjs', choices=['embed', 'cdn', 'directory'], default='embed',
+                       help='How HTML charts load plotly.js: embedded in each file, from the '
+                            'CDN, or from one plotly.min.js in the output directory')
     
     args = parser.parse_args()
     
@@ -33,38 +76,53 @@ def main():
     print("🛡️  Cross-Cultural Jailbreak Pattern Analyzer")
     print("=" * 50)
     
-    analyzer = JailbreakPatternAnalyzer()
     scorer = RiskScorer(args.output)
     visualizer = JailbreakVisualizer()
     
     # Load input data
     print(f"📂 Loading prompts from {args.input}...")
     try:
-        with open(args.input, 'r', encoding='utf-8') as f:
-            prompts = json.load(f)
+        prompts = orjson.loads(Path(args.input).read_bytes())
         print(f"✅ Loaded {len(prompts)} prompts")
     except Exception as e:
         print(f"❌ Error loading file: {e}")
         sys.exit(1)
     
-    # Analyze prompts
+    # Analyze each distinct prompt once, across all cores; repeated prompts
+    # reuse the earlier analysis. Languages are auto-detected, as before.
     print("\n🔍 Analyzing prompts...")
-    analyzed_prompts = []
-    
-    for prompt_data in tqdm(prompts, desc="Processing"):
-        analysis = analyzer.analyze_prompt(
-            prompt_data.get('prompt', ''),
-            prompt_data.get('language', 'auto')
+    prompt_keys = [p.get('prompt', '') for p in prompts]
+    unique_keys = list(dict.fromkeys(prompt_keys))
+    if len(unique_keys) < len(prompts):
+        print(f"🔁 {len(prompts) - len(unique_keys)} duplicate prompts will reuse earlier analyses")
+    
+    workers = os.cpu_count() or 1
+    chunksize = max(1, len(unique_keys) // (8 * workers))
+    
+    # On Linux, build the analyzer before starting workers so forked children
+    # inherit it. Elsewhere (notably macOS, where forking after numpy or
+    # Accelerate start threads is unsafe) keep the default start method and
+    # let each worker build its own through get_analyzer()
+    if sys.platform.startswith('linux'):
+        get_analyzer()
+        mp_context = multiprocessing.get_context('fork')
+    else:
+        mp_context = None
+    
+    # Aggregate results while the workers are still analyzing
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        results = tqdm(
+            pool.map(_analyze_one, unique_keys, chunksize=chunksize),
+            total=len(unique_keys),
+            desc="Processing"
         )
-        analysis['original_data'] = prompt_data
-        analyzed_prompts.append(analysis)
-        
-        if args.verbose and analysis['risk_score'] > 70:
-            print(f"\n⚠️  High risk detected (ID {prompt_data.get('id')}): Score {analysis['risk_score']}")
+        analyses = _stream(prompts, prompt_keys, unique_keys, results, args.verbose)
+        batch_results = scorer.batch_analyze(prompts, precomputed=analyses,
+                                             stream_detailed=args.stream_details)
     
-    # Generate batch analysis
-    print("\n📊 Generating batch analysis...")
-    batch_results = scorer.batch_analyze(prompts, analyzer)
+    print("\n📊 Batch analysis complete")
+    if args.stream_details:
+        print(f"🧾 Streamed per-prompt analyses to {batch_results['detailed_results_path']}")
     
     # Save results
     output_dir = Path(args.output)
@@ -72,8 +130,9 @@ def main():
     
     if args.format in ['json', 'all']:
         json_path = output_dir / f"analysis_{batch_results['analysis_id']}.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(batch_results, f, indent=2, ensure_ascii=False)
+        json_path.write_bytes(
+            orjson.dumps(batch_results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
         print(f"💾 Saved JSON results to {json_path}")
     
     if args.format in ['md', 'all']:
@@ -85,7 +144,9 @@ def main():
     
     if args.format in ['html', 'all']:
         print("📈 Generating visualizations...")
-        visualizer.save_all_charts(batch_results, str(output_dir))
+        include_plotlyjs = True if args.plotlyjs == 'embed' else args.plotlyjs
+        visualizer.save_all_charts(batch_results, str(output_dir),
+                                   include_plotlyjs=include_plotlyjs)
         print(f"🎨 Saved HTML charts to {output_dir}")
     
     # Print summary
@@ -3,12 +3,25 @@ Risk Scoring and Batch Analysis Module
 Processes multiple prompts and generates comprehensive reports
 """
 
-import json
-from typing import List, Dict, Optional
+from collections import Counter, defaultdict
+from typing import List, Dict, Callable, Iterable, Optional
 from datetime import datetime
-import pandas as pd
 from pathlib import Path
-import hashlib
+import contextlib
+import os
+import uuid
+import orjson
+
+# Report rendering tables: one 50-cell bar per whole 2% step, and the
+# marker shown beside each severity
+_SEVERITY_BARS = ['█' * filled + '░' * (50 - filled) for filled in range(51)]
+_SEVERITY_EMOJI = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡', 'LOW': '🟢', 'SAFE': '✅'}
+
+
+def _empty_effectiveness() -> Dict[str, int]:
+    """Fresh per-pattern effectiveness counters"""
+    return {'true_positives': 0, 'false_positives': 0, 'total': 0}
+
 
 class RiskScorer:
     def __init__(self, output_dir: str = "results"):
@@ -23,20 +36,31 @@ class RiskScorer:
         }
         
         # Track patterns for learning
-        self.pattern_effectiveness = {}
+        self.pattern_effectiveness = defaultdict(_empty_effectiveness)
         
-    def batch_analyze(self, prompts: List[Dict], analyzer) -> Dict:
+    def batch_analyze(self, prompts: List[Dict], analyzer=None,
+                      precomputed: Optional[Iterable[Dict]] = None,
+                      progress_callback: Optional[Callable[[int, int], None]] = None,
+                      stream_detailed: bool = False) -> Dict:
         """
         Analyze batch of prompts and generate statistics
         
         Args:
             prompts: List of prompt dictionaries
             analyzer: Instance of JailbreakPatternAnalyzer
+            precomputed: Optional analyses already produced for `prompts`
+                (same order), used instead of re-running the analyzer.
+                May be a lazy iterator, consumed as results arrive.
+            progress_callback: Optional callable invoked as
+                progress_callback(done, total) after each prompt
+            stream_detailed: Write each per-prompt analysis to
+                details_<analysis_id>.jsonl in the output directory as it
+                is aggregated, instead of keeping them in detailed_results.
+                The file's path is returned as detailed_results_path; it
+                appears there only once the whole batch has been written.
         """
         results = {
-            'analysis_id': hashlib.md5(
-                f"{datetime.now().isoformat()}".encode()
-            ).hexdigest()[:8],
+            'analysis_id': uuid.uuid4().hex[:8],
             'total_analyzed': len(prompts),
             'timestamp': datetime.now().isoformat(),
             'risk_distribution': {
@@ -46,7 +70,7 @@ class RiskScorer:
                 'LOW': 0,
                 'SAFE': 0
             },
-            'pattern_frequency': {},
+            'pattern_frequency': Counter(),
             'language_distribution': {'en': 0, 'zh': 0, 'mixed': 0},
             'detection_accuracy': {},
             'detailed_results': [],
@@ -55,71 +79,115 @@ class RiskScorer:
             'false_positives': []
         }
         
-        for prompt_data in prompts:
-            # Analyze each prompt
-            prompt_text = prompt_data.get('prompt', '')
-            expected_category = prompt_data.get('category', None)
-            known_effective = prompt_data.get('known_effective', None)
-            
-            analysis = analyzer.analyze_prompt(prompt_text)
-            
-            # Add metadata
-            analysis['original_id'] = prompt_data.get('id', None)
-            analysis['expected_category'] = expected_category
-            analysis['known_effective'] = known_effective
-            
-            # Count severity
-            severity = analysis.get('severity', 'SAFE')
-            results['risk_distribution'][severity] += 1
-            
-            # Track high-risk prompts
-            if analysis['risk_score'] >= 50:
-                results['high_risk_prompts'].append({
-                    'id': prompt_data.get('id'),
-                    'score': analysis['risk_score'],
-                    'preview': analysis['prompt_preview'][:100]
-                })
-            
-            # Count patterns
-            for pattern in analysis.get('detected_patterns', []):
-                pattern_type = pattern['type']
-                if pattern_type not in results['pattern_frequency']:
-                    results['pattern_frequency'][pattern_type] = 0
-                results['pattern_frequency'][pattern_type] += 1
+        if precomputed is not None:
+            precomputed = iter(precomputed)
+        
+        # Ground-truth tallies for detection metrics, kept as the batch runs
+        true_positives = 0
+        labeled_count = 0
+        
+        # Containers mutated on every prompt, bound once outside the loop
+        analyze_prompt = analyzer.analyze_prompt if precomputed is None else None
+        risk_distribution = results['risk_distribution']
+        pattern_frequency = results['pattern_frequency']
+        language_distribution = results['language_distribution']
+        high_risk_prompts = results['high_risk_prompts']
+        missed_detections = results['missed_detections']
+        false_positives = results['false_positives']
+        detailed_results = results['detailed_results']
+        total_analyzed = results['total_analyzed']
+        analyzed_count = 0
+        
+        # Per-prompt analyses either stay in memory or go straight to JSONL,
+        # written to a sibling temp file that is renamed into place once the
+        # batch completes
+        if stream_detailed:
+            details_path = self.output_dir / f"details_{results['analysis_id']}.jsonl"
+            details_tmp_path = details_path.with_name(details_path.name + '.tmp')
+            results['detailed_results_path'] = str(details_path)
+            details_sink = open(details_tmp_path, 'wb')
+        else:
+            details_sink = contextlib.nullcontext()
+        
+        with details_sink as details_file:
+            for prompt_data in prompts:
+                # Analyze each prompt
+                prompt_text = prompt_data.get('prompt', '')
+                expected_category = prompt_data.get('category', None)
+                known_effective = prompt_data.get('known_effective', None)
                 
-                # Track pattern effectiveness
-                self._update_pattern_effectiveness(
-                    pattern_type, 
-                    known_effective
-                )
-            
-            # Count language
-            lang = analysis.get('language_detected', 'en')
-            if lang in results['language_distribution']:
-                results['language_distribution'][lang] += 1
-            else:
-                results['language_distribution']['mixed'] += 1
-            
-            # Check detection accuracy if we have ground truth
-            if known_effective is not None:
-                detected = len(analysis['detected_patterns']) > 0
-                if known_effective and not detected:
-                    results['missed_detections'].append({
-                        'id': prompt_data.get('id'),
-                        'category': expected_category,
-                        'preview': prompt_text[:100]
-                    })
-                elif not known_effective and analysis['risk_score'] > 50:
-                    results['false_positives'].append({
+                if precomputed is not None:
+                    analysis = next(precomputed)
+                else:
+                    analysis = analyze_prompt(prompt_text)
+                
+                # Add metadata
+                analysis['original_id'] = prompt_data.get('id', None)
+                analysis['expected_category'] = expected_category
+                analysis['known_effective'] = known_effective
+                
+                # Count severity
+                severity = analysis.get('severity', 'SAFE')
+                risk_distribution[severity] += 1
+                
+                # Track high-risk prompts
+                if analysis['risk_score'] >= 50:
+                    high_risk_prompts.append({
                         'id': prompt_data.get('id'),
                         'score': analysis['risk_score'],
-                        'patterns': analysis['unique_pattern_types']
+                        'preview': analysis['prompt_preview'][:100]
                     })
-            
-            results['detailed_results'].append(analysis)
+                
+                # Count patterns in one Counter update per prompt
+                pattern_types = [pattern['type'] for pattern in analysis.get('detected_patterns', [])]
+                pattern_frequency.update(pattern_types)
+                
+                # Track pattern effectiveness
+                if known_effective is not None:
+                    for pattern_type in pattern_types:
+                        self._update_pattern_effectiveness(pattern_type, known_effective)
+                
+                # Count language
+                lang = analysis.get('language_detected', 'en')
+                if lang in language_distribution:
+                    language_distribution[lang] += 1
+                else:
+                    language_distribution['mixed'] += 1
+                
+                # Check detection accuracy if we have ground truth
+                if known_effective is not None:
+                    labeled_count += 1
+                    if known_effective == True and analysis['risk_score'] > 50:
+                        true_positives += 1
+                    
+                    detected = len(analysis['detected_patterns']) > 0
+                    if known_effective and not detected:
+                        missed_detections.append({
+                            'id': prompt_data.get('id'),
+                            'category': expected_category,
+                            'preview': prompt_text[:100]
+                        })
+                    elif not known_effective and analysis['risk_score'] > 50:
+                        false_positives.append({
+                            'id': prompt_data.get('id'),
+                            'score': analysis['risk_score'],
+                            'patterns': analysis['unique_pattern_types']
+                        })
+                
+                if stream_detailed:
+                    details_file.write(orjson.dumps(analysis) + b'\n')
+                else:
+                    detailed_results.append(analysis)
+                analyzed_count += 1
+                
+                if progress_callback is not None:
+                    progress_callback(analyzed_count, total_analyzed)
+        
+        if stream_detailed:
+            os.replace(details_tmp_path, details_path)
         
         # Calculate statistics
-        results = self._calculate_statistics(results)
+        results = self._calculate_statistics(results, true_positives, labeled_count)
         
         # Generate insights
         results['insights'] = self._generate_insights(results)
@@ -131,21 +199,23 @@ class RiskScorer:
         if effective is None:
             return
             
-        if pattern_type not in self.pattern_effectiveness:
-            self.pattern_effectiveness[pattern_type] = {
-                'true_positives': 0,
-                'false_positives': 0,
-                'total': 0
-            }
-        
-        self.pattern_effectiveness[pattern_type]['total'] += 1
+        stats = self.pattern_effectiveness[pattern_type]
+        stats['total'] += 1
         if effective:
-            self.pattern_effectiveness[pattern_type]['true_positives'] += 1
+            stats['true_positives'] += 1
         else:
-            self.pattern_effectiveness[pattern_type]['false_positives'] += 1
+            stats['false_positives'] += 1
     
-    def _calculate_statistics(self, results: Dict) -> Dict:
-        """Calculate comprehensive statistics"""
+    def _calculate_statistics(self, results: Dict, true_positives: int = 0,
+                              labeled_count: int = 0) -> Dict:
+        """
+        Calculate comprehensive statistics
+        
+        Args:
+            results: Batch results being assembled by batch_analyze
+            true_positives: Known-effective prompts scored above 50
+            labeled_count: Prompts carrying a known_effective label
+        """
         total = results['total_analyzed']
         
         if total > 0:
@@ -157,17 +227,11 @@ class RiskScorer:
             
             # Detection metrics
             if results['missed_detections'] or results['false_positives']:
-                total_known = len(results['missed_detections']) + len(results['false_positives'])
-                for res in results['detailed_results']:
-                    if res.get('known_effective') is not None:
-                        total_known += 1
+                # Missed detections and false positives are themselves labeled
+                # prompts, so they are already part of labeled_count
+                total_known = labeled_count
                 
                 if total_known > 0:
-                    true_positives = sum(
-                        1 for r in results['detailed_results']
-                        if r.get('known_effective') == True and r['risk_score'] > 50
-                    )
-                    
                     results['detection_accuracy'] = {
                         'precision': round(
                             true_positives / max(
@@ -217,7 +281,7 @@ class RiskScorer:
         
         # Pattern insights
         if results['pattern_frequency']:
-            top_pattern = max(results['pattern_frequency'].items(), key=lambda x: x[1])
+            top_pattern = results['pattern_frequency'].most_common(1)[0]
             insights.append(f"📊 Most common attack: {top_pattern[0]} ({top_pattern[1]} instances)")
         
         # Language insights
@@ -246,7 +310,8 @@ class RiskScorer:
     
     def generate_report(self, analysis_results: Dict) -> str:
         """Generate comprehensive markdown report"""
-        report = f"""# 🛡️ Jailbreak Analysis Report
+        # Sections are collected as parts and joined once at the end
+        parts = [f"""# 🛡️ Jailbreak Analysis Report
 **Report ID:** {analysis_results['analysis_id']}  
 **Generated:** {analysis_results['timestamp']}  
 **Total Prompts Analyzed:** {analysis_results['total_analyzed']}
@@ -256,33 +321,31 @@ class RiskScorer:
 ## 📊 Executive Summary
 
 ### Risk Distribution
-"""
+"""]
         
         # Risk distribution with visual bars
         for severity in ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW', 'SAFE']:
             count = analysis_results['risk_distribution'][severity]
             percentage = analysis_results['risk_percentages'][severity]
-            bar_length = int(percentage / 2)
-            bar = '█' * bar_length + '░' * (50 - bar_length)
-            emoji = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡', 
-                    'LOW': '🟢', 'SAFE': '✅'}[severity]
-            report += f"{emoji} **{severity:8}** [{bar}] {count:3} ({percentage}%)\n"
+            bar = _SEVERITY_BARS[int(percentage / 2)]
+            emoji = _SEVERITY_EMOJI[severity]
+            parts.append(f"{emoji} **{severity:8}** [{bar}] {count:3} ({percentage}%)\n")
         
         # Detection accuracy if available
         if analysis_results.get('detection_accuracy'):
-            report += f"""
+            parts.append(f"""
 ### 🎯 Detection Performance
 - **Precision:** {analysis_results['detection_accuracy']['precision']}%
 - **Recall:** {analysis_results['detection_accuracy']['recall']}%
 - **False Positive Rate:** {analysis_results['detection_accuracy']['false_positive_rate']}%
 - **Miss Rate:** {analysis_results['detection_accuracy']['miss_rate']}%
-"""
+""")
         
         # Pattern distribution
-        report += "\n## 🔍 Attack Pattern Analysis\n\n"
+        parts.append("\n## 🔍 Attack Pattern Analysis\n\n")
         if analysis_results['pattern_frequency']:
-            report += "| Pattern Type | Occurrences | Frequency |\n"
-            report += "|--------------|-------------|----------|\n"
+            parts.append("| Pattern Type | Occurrences | Frequency |\n")
+            parts.append("|--------------|-------------|----------|\n")
             
             total_patterns = sum(analysis_results['pattern_frequency'].values())
             for pattern, count in sorted(
@@ -291,75 +354,75 @@ class RiskScorer:
                 reverse=True
             ):
                 freq = round(count / total_patterns * 100, 1)
-                report += f"| {pattern} | {count} | {freq}% |\n"
+                parts.append(f"| {pattern} | {count} | {freq}% |\n")
         
         # Language distribution
-        report += f"\n## 🌐 Language Distribution\n"
+        parts.append(f"\n## 🌐 Language Distribution\n")
         for lang, percentage in analysis_results['language_percentages'].items():
             lang_name = {'en': 'English', 'zh': 'Chinese', 'mixed': 'Mixed'}[lang]
-            report += f"- **{lang_name}:** {percentage}%\n"
+            parts.append(f"- **{lang_name}:** {percentage}%\n")
         
         # High-risk prompts
         if analysis_results['high_risk_prompts']:
-            report += f"\n## ⚠️ High-Risk Prompts (Top 5)\n\n"
+            parts.append(f"\n## ⚠️ High-Risk Prompts (Top 5)\n\n")
             for i, prompt in enumerate(analysis_results['high_risk_prompts'][:5], 1):
-                report += f"{i}. **ID {prompt['id']}** (Score: {prompt['score']})\n"
-                report += f"   > {prompt['preview']}...\n\n"
+                parts.append(f"{i}. **ID {prompt['id']}** (Score: {prompt['score']})\n")
+                parts.append(f"   > {prompt['preview']}...\n\n")
         
         # Missed detections
         if analysis_results['missed_detections']:
-            report += f"\n## 🔴 Missed Detections\n\n"
-            report += "These known jailbreaks were not detected:\n\n"
+            parts.append(f"\n## 🔴 Missed Detections\n\n")
+            parts.append("These known jailbreaks were not detected:\n\n")
             for miss in analysis_results['missed_detections'][:5]:
-                report += f"- **ID {miss['id']}** ({miss['category']})\n"
-                report += f"  > {miss['preview']}...\n\n"
+                parts.append(f"- **ID {miss['id']}** ({miss['category']})\n")
+                parts.append(f"  > {miss['preview']}...\n\n")
         
         # Insights
         if analysis_results.get('insights'):
-            report += f"\n## 💡 Key Insights\n\n"
+            parts.append(f"\n## 💡 Key Insights\n\n")
             for insight in analysis_results['insights']:
-                report += f"- {insight}\n"
+                parts.append(f"- {insight}\n")
         
         # Pattern effectiveness
         if analysis_results.get('pattern_effectiveness'):
-            report += f"\n## 📈 Pattern Effectiveness\n\n"
-            report += "| Pattern | Effectiveness |\n"
-            report += "|---------|---------------|\n"
+            parts.append(f"\n## 📈 Pattern Effectiveness\n\n")
+            parts.append("| Pattern | Effectiveness |\n")
+            parts.append("|---------|---------------|\n")
             for pattern, eff in sorted(
                 analysis_results['pattern_effectiveness'].items(),
                 key=lambda x: x[1],
                 reverse=True
             ):
-                report += f"| {pattern} | {eff}% |\n"
+                parts.append(f"| {pattern} | {eff}% |\n")
         
         # Recommendations
-        report += self._generate_recommendations(analysis_results)
+        parts.append(self._generate_recommendations(analysis_results))
         
-        return report
+        return ''.join(parts)
     
     def _generate_recommendations(self, results: Dict) -> str:
         """Generate actionable recommendations"""
-        recommendations = "\n## 🎯 Recommendations\n\n"
+        recommendations = ["\n## 🎯 Recommendations\n\n"]
         
         # Based on risk distribution
         if results['risk_percentages'].get('CRITICAL', 0) > 15:
-            recommendations += "1. **Immediate Action:** Implement stricter filtering for CRITICAL patterns\n"
+            recommendations.append("1. **Immediate Action:** Implement stricter filtering for CRITICAL patterns\n")
         
         # Based on patterns
         if 'pattern_effectiveness' in results:
             weak = [p for p, e in results['pattern_effectiveness'].items() if e < 60]
             if weak:
-                recommendations += f"2. **Pattern Review:** Improve detection for: {', '.join(weak[:3])}\n"
+                recommendations.append(f"2. **Pattern Review:** Improve detection for: {', '.join(weak[:3])}\n")
         
         # Based on language
         if results['language_percentages'].get('zh', 0) > 20:
-            recommendations += "3. **Cultural Adaptation:** Enhance Chinese-specific pattern detection\n"
+            recommendations.append("3. **Cultural Adaptation:** Enhance Chinese-specific pattern detection\n")
         
         # Based on accuracy
         if results.get('detection_accuracy', {}).get('miss_rate', 0) > 5:
-            recommendations += "4. **Sensitivity Tuning:** Lower detection thresholds for known patterns\n"
+            recommendations.append("4. **Sensitivity Tuning:** Lower detection thresholds for known patterns\n")
         
-        return recommendations
+        return ''.join(recommendations)
     
     def save_results(self, results: Dict, filename: Optional[str] = None):
         """Save analysis results to file"""
@@ -367,7 +430,13 @@ class RiskScorer:
             filename = f"analysis_{results['analysis_id']}.json"
         
         filepath = self.output_dir / filename
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        
+        # Write a sibling temp file and rename it into place, so readers of
+        # filepath never see a partially written result
+        tmp_path = filepath.with_name(filepath.name + '.tmp')
+        tmp_path.write_bytes(
+            orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
+        os.replace(tmp_path, filepath)
         
         return filepath
\ No newline at end of file
@@ -4,13 +4,87 @@ Creates interactive charts and dashboards
 """
 
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import pandas as pd
-from typing import Dict, List
-import json
+import plotly.io as pio
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import hashlib
+import orjson
+
+
+def _downsample_lttb(indices, values, threshold: int = 2000) -> np.ndarray:
+    """
+    Pick at most threshold points of a series with Largest-Triangle-Three-Buckets
+    
+    Returns the positions of the kept points, always including the first and
+    last, so callers can slice any per-point data (colors, labels) alongside.
+    """
+    x = np.asarray(indices, dtype=float)
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+    
+    # Interior points go into threshold - 2 buckets; each bucket keeps the
+    # point forming the largest triangle with the previously kept point and
+    # the average of the next bucket (the last point for the final bucket)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    counts = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1)[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1)[1:] / counts[1:], y[-1])
+    
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = a = 0
+    kept[-1] = n - 1
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+def _top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest values, largest first, ties in original order"""
+    n = len(values)
+    if n <= k:
+        return np.argsort(-values, kind='stable')
+    
+    # Partition to the k-th largest value, then keep everything above it and
+    # the earliest of the values equal to it, as a stable sort would
+    kth = np.partition(values, n - k)[n - k]
+    above = np.flatnonzero(values > kth)
+    ties = np.flatnonzero(values == kth)[:k - len(above)]
+    top = np.concatenate((above, ties))
+    top.sort()
+    return top[np.argsort(-values[top], kind='stable')]
+
+
+@dataclass
+class ChartArrays:
+    """Plot-ready data extracted once from batch results and shared by all charts"""
+    # Explicit slots rather than dataclass(slots=True), which needs Python 3.10
+    __slots__ = ('risk_labels', 'risk_values', 'risk_colors', 'pattern_names',
+                 'pattern_freqs', 'lang_labels', 'lang_values', 'timeline_idx',
+                 'timeline_scores', 'timeline_severity')
+    
+    risk_labels: List[str]
+    risk_values: np.ndarray
+    risk_colors: List[str]
+    pattern_names: List[str]
+    pattern_freqs: np.ndarray
+    lang_labels: List[str]
+    lang_values: np.ndarray
+    timeline_idx: np.ndarray
+    timeline_scores: np.ndarray
+    timeline_severity: np.ndarray
 
 class JailbreakVisualizer:
+    # Rendered chart HTML is kept for this many (results, chart) pairs
+    HTML_CACHE_SIZE = 64
+    
     def __init__(self):
         self.color_scheme = {
             'CRITICAL': '#d32f2f',
@@ -20,19 +94,85 @@ class JailbreakVisualizer:
             'SAFE': '#388e3c'
         }
         
-    def create_risk_distribution_chart(self, analysis_results: Dict) -> go.Figure:
+        # Severities as small ints, colored through a stepped colorscale so
+        # Plotly gets numeric marker arrays instead of validating a hex
+        # string per point
+        self._severity_codes = {severity: i for i, severity in enumerate(self.color_scheme)}
+        self._severity_colorscale = [
+            [i / (len(self.color_scheme) - 1), color]
+            for i, color in enumerate(self.color_scheme.values())
+        ]
+        
+        # Chart HTML keyed by (chart data digest, chart name, plotly.js mode), oldest first
+        self._html_cache = OrderedDict()
+        
+    def _extract_arrays(self, analysis_results: Dict) -> ChartArrays:
+        """Extract every chart's data from batch results in one pass"""
+        risk_distribution = analysis_results['risk_distribution']
+        pattern_frequency = analysis_results.get('pattern_frequency') or {}
+        language_distribution = analysis_results['language_distribution']
+        risk_labels = list(risk_distribution)
+        detailed_results = analysis_results.get('detailed_results')
+        if not detailed_results and analysis_results.get('detailed_results_path'):
+            timeline = self._read_timeline(analysis_results['detailed_results_path'])
+        else:
+            timeline = self._extract_timeline(detailed_results or [])
+        timeline_idx, timeline_scores, timeline_severity = timeline
+        
+        return ChartArrays(
+            risk_labels=risk_labels,
+            risk_values=np.fromiter(risk_distribution.values(), dtype=np.int64,
+                                    count=len(risk_distribution)),
+            risk_colors=[self.color_scheme[label] for label in risk_labels],
+            pattern_names=list(pattern_frequency),
+            pattern_freqs=np.fromiter(pattern_frequency.values(), dtype=np.int64,
+                                      count=len(pattern_frequency)),
+            lang_labels=list(language_distribution),
+            lang_values=np.fromiter(language_distribution.values(), dtype=np.int64,
+                                    count=len(language_distribution)),
+            timeline_idx=timeline_idx,
+            timeline_scores=timeline_scores,
+            timeline_severity=timeline_severity
+        )
+    
+    def _extract_timeline(self, detailed_results: List[Dict]):
+        """Return prompt indices, risk scores and severity codes as plot arrays"""
+        n = len(detailed_results)
+        scores = np.fromiter((r.get('risk_score', 0) for r in detailed_results),
+                             dtype=np.float64, count=n)
+        codes = self._severity_codes
+        severity = np.fromiter((codes[r.get('severity', 'SAFE')] for r in detailed_results),
+                               dtype=np.int8, count=n)
+        return np.arange(n), scores, severity
+    
+    def _read_timeline(self, details_path: str):
+        """Timeline arrays from a streamed details JSONL, without keeping the analyses"""
+        codes = self._severity_codes
+        scores = []
+        severity = []
+        with open(details_path, 'rb') as f:
+            for line in f:
+                analysis = orjson.loads(line)
+                scores.append(analysis.get('risk_score', 0))
+                severity.append(codes[analysis.get('severity', 'SAFE')])
+        return (np.arange(len(scores)), np.array(scores, dtype=np.float64),
+                np.array(severity, dtype=np.int8))
+    
+    def create_risk_distribution_chart(self, analysis_results: Dict,
+                                       arrays: Optional[ChartArrays] = None) -> go.Figure:
         """Create risk distribution pie chart"""
         
-        labels = list(analysis_results['risk_distribution'].keys())
-        values = list(analysis_results['risk_distribution'].values())
-        colors = [self.color_scheme[label] for label in labels]
+        if not sum((analysis_results.get('risk_distribution') or {}).values()):
+            return self._create_empty_chart("No risk data available")
+        
+        arrays = arrays or self._extract_arrays(analysis_results)
         
         fig = go.Figure(data=[
             go.Pie(
-                labels=labels,
-                values=values,
+                labels=arrays.risk_labels,
+                values=arrays.risk_values,
                 hole=0.3,
-                marker=dict(colors=colors),
+                marker=dict(colors=arrays.risk_colors),
                 textinfo='label+percent',
                 textposition='auto',
                 hovertemplate='<b>%{label}</b><br>' +
@@ -40,34 +180,29 @@ class JailbreakVisualizer:
                             'Percentage: %{percent}<br>' +
                             '<extra></extra>'
             )
-        ])
-        
-        fig.update_layout(
+        ], layout=dict(
             title="Risk Severity Distribution",
             title_font_size=20,
             showlegend=True,
             height=400,
             margin=dict(t=50, b=50, l=50, r=50)
-        )
+        ))
         
         return fig
     
-    def create_pattern_frequency_chart(self, analysis_results: Dict) -> go.Figure:
+    def create_pattern_frequency_chart(self, analysis_results: Dict,
+                                       arrays: Optional[ChartArrays] = None) -> go.Figure:
         """Create pattern frequency bar chart"""
         
         if not analysis_results.get('pattern_frequency'):
             return self._create_empty_chart("No patterns detected")
         
-        patterns = list(analysis_results['pattern_frequency'].keys())
-        frequencies = list(analysis_results['pattern_frequency'].values())
-        
-        # Sort by frequency
-        sorted_data = sorted(zip(patterns, frequencies), key=lambda x: x[1], reverse=True)
-        patterns, frequencies = zip(*sorted_data)
+        arrays = arrays or self._extract_arrays(analysis_results)
         
-        # Take top 10
-        patterns = patterns[:10]
-        frequencies = frequencies[:10]
+        # Top 10 by frequency (ties keep their original order)
+        top = _top_k(arrays.pattern_freqs, 10)
+        patterns = [arrays.pattern_names[i] for i in top.tolist()]
+        frequencies = arrays.pattern_freqs[top]
         
         fig = go.Figure([
             go.Bar(
@@ -86,35 +221,38 @@ class JailbreakVisualizer:
                             'Count: %{x}<br>' +
                             '<extra></extra>'
             )
-        ])
-        
-        fig.update_layout(
+        ], layout=dict(
             title="Top Attack Patterns Detected",
             xaxis_title="Frequency",
             yaxis_title="Pattern Type",
             height=400,
             margin=dict(l=150),
             showlegend=False
-        )
+        ))
         
         return fig
     
-    def create_language_distribution_chart(self, analysis_results: Dict) -> go.Figure:
+    def create_language_distribution_chart(self, analysis_results: Dict,
+                                           arrays: Optional[ChartArrays] = None) -> go.Figure:
         """Create language distribution donut chart"""
         
+        if not sum((analysis_results.get('language_distribution') or {}).values()):
+            return self._create_empty_chart("No language data available")
+        
+        arrays = arrays or self._extract_arrays(analysis_results)
+        
         languages = {
             'en': 'English',
             'zh': 'Chinese',
             'mixed': 'Mixed'
         }
         
-        labels = [languages.get(k, k) for k in analysis_results['language_distribution'].keys()]
-        values = list(analysis_results['language_distribution'].values())
+        labels = [languages.get(k, k) for k in arrays.lang_labels]
         
         fig = go.Figure(data=[
             go.Pie(
                 labels=labels,
-                values=values,
+                values=arrays.lang_values,
                 hole=0.4,
                 marker=dict(colors=['#1976d2', '#d32f2f', '#7b1fa2']),
                 textinfo='label+value',
@@ -123,44 +261,58 @@ class JailbreakVisualizer:
                             'Percentage: %{percent}<br>' +
                             '<extra></extra>'
             )
-        ])
-        
-        fig.update_layout(
+        ], layout=dict(
             title="Language Distribution",
             annotations=[
                 dict(text='Languages', x=0.5, y=0.5, font_size=20, showarrow=False)
             ],
             height=400
-        )
+        ))
         
         return fig
     
-    def create_detection_timeline(self, detailed_results: List[Dict]) -> go.Figure:
-        """Create timeline of risk scores"""
-        
-        # Extract data
-        indices = list(range(len(detailed_results)))
-        risk_scores = [r.get('risk_score', 0) for r in detailed_results]
-        severities = [r.get('severity', 'SAFE') for r in detailed_results]
-        colors = [self.color_scheme[s] for s in severities]
-        
-        fig = go.Figure()
-        
-        # Add scatter plot
-        fig.add_trace(go.Scatter(
+    def create_detection_timeline(self, detailed_results: List[Dict],
+                                  max_points: int = 2000,
+                                  arrays: Optional[ChartArrays] = None) -> go.Figure:
+        """Create timeline of risk scores, downsampled to at most max_points"""
+        
+        # Streamed batches have no detailed_results but arrive with arrays
+        # read from their details file
+        if not detailed_results and (arrays is None or not arrays.timeline_idx.size):
+            return self._create_empty_chart("No prompts analyzed")
+        
+        # Extract data (arrays go to Plotly without per-element validation)
+        if arrays is None:
+            indices, risk_scores, severity = self._extract_timeline(detailed_results)
+        else:
+            indices, risk_scores, severity = (arrays.timeline_idx, arrays.timeline_scores,
+                                              arrays.timeline_severity)
+        
+        # Long batches keep only the points that shape the line
+        if len(indices) > max_points:
+            kept = _downsample_lttb(indices, risk_scores, max_points)
+            indices = kept
+            risk_scores = risk_scores[kept]
+            severity = severity[kept]
+        
+        # Scatter plot (WebGL, so long batches stay responsive)
+        scatter = go.Scattergl(
             x=indices,
             y=risk_scores,
             mode='markers+lines',
             marker=dict(
                 size=8,
-                color=colors,
+                color=severity,
+                colorscale=self._severity_colorscale,
+                cmin=0,
+                cmax=len(self._severity_colorscale) - 1,
                 line=dict(width=1, color='white')
             ),
             line=dict(width=1, color='gray', dash='dot'),
             hovertemplate='Prompt #%{x}<br>' +
                         'Risk Score: %{y}<br>' +
                         '<extra></extra>'
-        ))
+        )
         
         # Add threshold lines
         thresholds = [
@@ -170,58 +322,114 @@ class JailbreakVisualizer:
             (10, 'LOW', '#689f38')
         ]
         
-        for threshold, label, color in thresholds:
-            fig.add_hline(
-                y=threshold,
-                line_dash="dash",
-                line_color=color,
-                opacity=0.3,
-                annotation_text=label,
-                annotation_position="right"
-            )
+        # Lines and labels are passed with the rest of the layout below
+        # (what add_hline would add one call at a time)
+        shapes = [
+            dict(type='line', xref='x domain', x0=0, x1=1, yref='y', y0=threshold, y1=threshold,
+                 line=dict(color=color, dash='dash'), opacity=0.3)
+            for threshold, _, color in thresholds
+        ]
+        annotations = [
+            dict(text=label, showarrow=False, xref='x domain', x=1, xanchor='left',
+                 yref='y', y=threshold, yanchor='middle')
+            for threshold, label, _ in thresholds
+        ]
         
-        fig.update_layout(
+        fig = go.Figure(data=[scatter], layout=dict(
+            shapes=shapes,
+            annotations=annotations,
             title="Risk Score Timeline",
             xaxis_title="Prompt Index",
             yaxis_title="Risk Score",
             height=400,
             showlegend=False,
             yaxis=dict(range=[0, 105])
-        )
+        ))
         
         return fig
     
-    def create_pattern_effectiveness_chart(self, analysis_results: Dict) -> go.Figure:
-        """Create pattern effectiveness gauge chart"""
+    def create_pattern_effectiveness_chart(self, analysis_results: Dict,
+                                           style: str = 'bar') -> go.Figure:
+        """
+        Create pattern effectiveness chart
+        
+        The default 'bar' style draws every pattern in a single bar trace;
+        style='gauges' draws one gauge per pattern for the first six.
+        """
         
         if not analysis_results.get('pattern_effectiveness'):
             return self._create_empty_chart("No effectiveness data available")
         
-        # Create subplots for multiple gauges
-        patterns = list(analysis_results['pattern_effectiveness'].keys())[:6]
-        effectiveness = [analysis_results['pattern_effectiveness'][p] for p in patterns]
+        if style == 'gauges':
+            return self._create_effectiveness_gauges(analysis_results['pattern_effectiveness'])
+        
+        patterns = list(analysis_results['pattern_effectiveness'].keys())
+        effectiveness = np.fromiter(analysis_results['pattern_effectiveness'].values(),
+                                    dtype=np.float64, count=len(patterns))
+        colors = ['#d32f2f' if eff < 50 else '#fbc02d' if eff < 75 else '#388e3c'
+                  for eff in effectiveness.tolist()]
+        
+        fig = go.Figure([
+            go.Bar(
+                x=effectiveness,
+                y=patterns,
+                orientation='h',
+                marker=dict(color=colors),
+                text=effectiveness,
+                textposition='auto',
+                hovertemplate='<b>%{y}</b><br>' +
+                            'Effectiveness: %{x}%<br>' +
+                            '<extra></extra>'
+            )
+        ], layout=dict(
+            title="Pattern Effectiveness (%)",
+            xaxis=dict(title="Effectiveness (%)", range=[0, 100]),
+            yaxis_title="Pattern Type",
+            height=500,
+            margin=dict(l=150),
+            showlegend=False,
+            # 90% reference line, as on the gauges
+            shapes=[dict(
+                type='line', xref='x', yref='paper',
+                x0=90, x1=90, y0=0, y1=1,
+                line=dict(color='red', width=2)
+            )]
+        ))
+        
+        return fig
+    
+    def _create_effectiveness_gauges(self, pattern_effectiveness: Dict) -> go.Figure:
+        """Create a 2x3 grid of effectiveness gauges for the first six patterns"""
+        
+        patterns = list(pattern_effectiveness.keys())[:6]
+        effectiveness = [pattern_effectiveness[p] for p in patterns]
         
         rows = 2
         cols = 3
         
-        fig = make_subplots(
-            rows=rows, cols=cols,
-            specs=[[{'type': 'indicator'} for _ in range(cols)] for _ in range(rows)],
-            subplot_titles=patterns
-        )
+        # Lay the gauges out on explicit paper domains (the grid make_subplots
+        # would compute) rather than paying for its per-cell validation
+        x_gap = 0.2 / cols
+        y_gap = 0.25
+        width = (1 - x_gap * (cols - 1)) / cols
+        height = (1 - y_gap * (rows - 1)) / rows
         
+        gauges = []
+        titles = []
         for i, (pattern, eff) in enumerate(zip(patterns, effectiveness)):
-            row = i // cols + 1
-            col = i % cols + 1
+            row = i // cols
+            col = i % cols
+            x0 = col * (width + x_gap)
+            y1 = 1 - row * (height + y_gap)
             
             color = '#d32f2f' if eff < 50 else '#fbc02d' if eff < 75 else '#388e3c'
             
-            fig.add_trace(
+            gauges.append(
                 go.Indicator(
                     mode="gauge+number",
                     value=eff,
                     title={'text': ""},
-                    domain={'x': [0, 1], 'y': [0, 1]},
+                    domain={'x': [x0, x0 + width], 'y': [y1 - height, y1]},
                     gauge={
                         'axis': {'range': [None, 100]},
                         'bar': {'color': color},
@@ -235,20 +443,32 @@ class JailbreakVisualizer:
                             'value': 90
                         }
                     }
-                ),
-                row=row, col=col
+                )
             )
+            titles.append(dict(
+                text=pattern, showarrow=False, font=dict(size=16),
+                xref='paper', x=x0 + width / 2, xanchor='center',
+                yref='paper', y=y1, yanchor='bottom'
+            ))
         
-        fig.update_layout(
+        fig = go.Figure(data=gauges, layout=dict(
             title="Pattern Effectiveness (%)",
+            annotations=titles,
             height=500,
             showlegend=False
-        )
+        ))
         
         return fig
     
-    def create_comprehensive_dashboard(self, analysis_results: Dict) -> go.Figure:
+    def create_comprehensive_dashboard(self, analysis_results: Dict,
+                                       arrays: Optional[ChartArrays] = None) -> go.Figure:
         """Create comprehensive dashboard with multiple visualizations"""
+        from plotly.subplots import make_subplots
+        
+        if not sum((analysis_results.get('risk_distribution') or {}).values()):
+            return self._create_empty_chart("No analysis data available")
+        
+        arrays = arrays or self._extract_arrays(analysis_results)
         
         fig = make_subplots(
             rows=3, cols=2,
@@ -262,7 +482,7 @@ class JailbreakVisualizer:
             ),
             specs=[
                 [{'type': 'pie'}, {'type': 'bar'}],
-                [{'type': 'pie'}, {'type': 'scatter'}],
+                [{'type': 'pie'}, {'type': 'scattergl'}],
                 [{'type': 'indicator'}, {'type': 'bar'}]
             ],
             row_heights=[0.33, 0.33, 0.34],
@@ -271,15 +491,11 @@ class JailbreakVisualizer:
         )
         
         # 1. Risk Distribution (Pie)
-        labels = list(analysis_results['risk_distribution'].keys())
-        values = list(analysis_results['risk_distribution'].values())
-        colors = [self.color_scheme[label] for label in labels]
-        
         fig.add_trace(
             go.Pie(
-                labels=labels,
-                values=values,
-                marker=dict(colors=colors),
+                labels=arrays.risk_labels,
+                values=arrays.risk_values,
+                marker=dict(colors=arrays.risk_colors),
                 textinfo='percent',
                 hovertemplate='%{label}: %{value}<extra></extra>'
             ),
@@ -288,8 +504,9 @@ class JailbreakVisualizer:
         
         # 2. Pattern Frequency (Bar)
         if analysis_results.get('pattern_frequency'):
-            patterns = list(analysis_results['pattern_frequency'].keys())[:5]
-            frequencies = [analysis_results['pattern_frequency'][p] for p in patterns]
+            top = _top_k(arrays.pattern_freqs, 5)
+            patterns = [arrays.pattern_names[i] for i in top.tolist()]
+            frequencies = arrays.pattern_freqs[top]
             
             fig.add_trace(
                 go.Bar(
@@ -304,13 +521,10 @@ class JailbreakVisualizer:
             )
         
         # 3. Language Distribution (Pie)
-        lang_labels = list(analysis_results['language_distribution'].keys())
-        lang_values = list(analysis_results['language_distribution'].values())
-        
         fig.add_trace(
             go.Pie(
-                labels=lang_labels,
-                values=lang_values,
+                labels=arrays.lang_labels,
+                values=arrays.lang_values,
                 marker=dict(colors=['#1976d2', '#d32f2f', '#7b1fa2']),
                 textinfo='label+percent'
             ),
@@ -318,16 +532,25 @@ class JailbreakVisualizer:
         )
         
         # 4. Risk Timeline (Scatter)
-        if analysis_results.get('detailed_results'):
-            indices = list(range(len(analysis_results['detailed_results'])))[:50]
-            scores = [r.get('risk_score', 0) for r in analysis_results['detailed_results']][:50]
+        if arrays.timeline_idx.size:
+            indices = arrays.timeline_idx
+            scores = arrays.timeline_scores
+            if len(scores) > 1000:
+                indices = _downsample_lttb(indices, scores, 1000)
+                scores = scores[indices]
+            
+            # Bin scores at the severity thresholds (SAFE=0 .. CRITICAL=4) and
+            # flip to severity codes, so each point gets its severity color
+            # straight off a stepped colorscale
+            severity = (4 - np.digitize(scores, [10, 30, 50, 70])).astype(np.int8)
             
             fig.add_trace(
-                go.Scatter(
+                go.Scattergl(
                     x=indices,
                     y=scores,
                     mode='lines+markers',
-                    marker=dict(size=5, color=scores, colorscale='RdYlGn_r'),
+                    marker=dict(size=5, color=severity, colorscale=self._severity_colorscale,
+                                cmin=0, cmax=len(self._severity_colorscale) - 1),
                     line=dict(width=1)
                 ),
                 row=2, col=2
@@ -380,39 +603,147 @@ class JailbreakVisualizer:
     
     def _create_empty_chart(self, message: str) -> go.Figure:
         """Create empty chart with message"""
-        fig = go.Figure()
-        fig.add_annotation(
-            text=message,
-            xref="paper",
-            yref="paper",
-            x=0.5,
-            y=0.5,
-            showarrow=False,
-            font=dict(size=20, color="gray")
-        )
-        fig.update_layout(
+        # One constructor call validates the layout once, instead of again
+        # for add_annotation and update_layout
+        return go.Figure(layout=dict(
+            annotations=[dict(
+                text=message,
+                xref="paper",
+                yref="paper",
+                x=0.5,
+                y=0.5,
+                showarrow=False,
+                font=dict(size=20, color="gray")
+            )],
             xaxis=dict(visible=False),
             yaxis=dict(visible=False),
             height=400
-        )
-        return fig
+        ))
     
-    def save_all_charts(self, analysis_results: Dict, output_dir: str = "results"):
-        """Save all charts as HTML files"""
+    def save_all_charts(self, analysis_results: Dict, output_dir: str = "results",
+                        formats: Tuple[str, ...] = ('html',),
+                        include_plotlyjs: Union[bool, str] = True):
+        """
+        Save all charts in each of the given formats
+        
+        'html' writes standalone pages with plotly.js embedded in each one.
+        include_plotlyjs='cdn' loads it from the CDN instead, and 'directory'
+        from one plotly.min.js written next to the pages. Static formats ('png', 'svg', 'pdf', ...) need the
+        optional kaleido>=1.0 package and are rendered for all charts in a
+        single batch.
+        """
         import os
+        if isinstance(formats, str):
+            raise TypeError(f"formats must be a sequence of format names, "
+                            f"e.g. ('{formats}',), not a string")
         os.makedirs(output_dir, exist_ok=True)
         
+        # Chart data is extracted at most once, on the first cache miss
+        arrays = None
+        
+        def shared_arrays():
+            nonlocal arrays
+            if arrays is None:
+                arrays = self._extract_arrays(analysis_results)
+            return arrays
+        
         charts = {
-            'risk_distribution': self.create_risk_distribution_chart(analysis_results),
-            'pattern_frequency': self.create_pattern_frequency_chart(analysis_results),
-            'language_distribution': self.create_language_distribution_chart(analysis_results),
-            'detection_timeline': self.create_detection_timeline(
-                analysis_results.get('detailed_results', [])
+            'risk_distribution': lambda: self.create_risk_distribution_chart(
+                analysis_results, arrays=shared_arrays()
+            ),
+            'pattern_frequency': lambda: self.create_pattern_frequency_chart(
+                analysis_results, arrays=shared_arrays()
+            ),
+            'language_distribution': lambda: self.create_language_distribution_chart(
+                analysis_results, arrays=shared_arrays()
             ),
-            'dashboard': self.create_comprehensive_dashboard(analysis_results)
+            'detection_timeline': lambda: self.create_detection_timeline(
+                analysis_results.get('detailed_results', []), arrays=shared_arrays()
+            ),
+            'dashboard': lambda: self.create_comprehensive_dashboard(
+                analysis_results, arrays=shared_arrays()
+            )
         }
         
-        for name, fig in charts.items():
-            filepath = os.path.join(output_dir, f"{name}.html")
-            fig.write_html(filepath)
-            print(f"Saved {name} to {filepath}")
\ No newline at end of file
+        # Each figure is built at most once, however many formats need it
+        figures = {}
+        
+        def figure(name):
+            if name not in figures:
+                figures[name] = charts[name]()
+            return figures[name]
+        
+        if 'html' in formats:
+            # Re-exporting the same chart data reuses the rendered HTML
+            results_key = self._charts_key(analysis_results, shared_arrays())
+            
+            # Offline pages share a single copy of the bundle, rewritten when
+            # it is missing or left over from another plotly version
+            if include_plotlyjs == 'directory':
+                from plotly.offline import get_plotlyjs
+                bundle = get_plotlyjs()
+                bundle_path = os.path.join(output_dir, 'plotly.min.js')
+                try:
+                    with open(bundle_path, encoding='utf-8') as f:
+                        current = f.read()
+                except (OSError, UnicodeDecodeError):
+                    current = None
+                if current != bundle:
+                    with open(bundle_path, 'w', encoding='utf-8') as f:
+                        f.write(bundle)
+            
+            for name in charts:
+                filepath = os.path.join(output_dir, f"{name}.html")
+                html = self._chart_html((results_key, name, include_plotlyjs),
+                                        lambda: figure(name), include_plotlyjs)
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    f.write(html)
+                print(f"Saved {name} to {filepath}")
+        
+        # Static images for every chart and format go through one Kaleido
+        # session where plotly has write_images (6.1+); older versions
+        # export one figure at a time
+        image_formats = [fmt for fmt in formats if fmt != 'html']
+        if image_formats:
+            jobs = [(name, fmt) for fmt in image_formats for name in charts]
+            filepaths = [os.path.join(output_dir, f"{name}.{fmt}") for name, fmt in jobs]
+            if hasattr(pio, 'write_images'):
+                pio.write_images(
+                    [figure(name) for name, _ in jobs],
+                    filepaths,
+                    format=[fmt for _, fmt in jobs]
+                )
+            else:
+                for (name, fmt), filepath in zip(jobs, filepaths):
+                    pio.write_image(figure(name), filepath, format=fmt)
+            for (name, _), filepath in zip(jobs, filepaths):
+                print(f"Saved {name} to {filepath}")
+    
+    def _charts_key(self, analysis_results: Dict, arrays: ChartArrays) -> bytes:
+        """Digest of just the batch fields that save_all_charts' charts read"""
+        summary = {
+            'risk_distribution': analysis_results.get('risk_distribution'),
+            'pattern_frequency': analysis_results.get('pattern_frequency'),
+            'language_distribution': analysis_results.get('language_distribution'),
+            'detection_accuracy': analysis_results.get('detection_accuracy'),
+            'insights': len(analysis_results.get('insights') or ()),
+        }
+        digest = hashlib.blake2b(orjson.dumps(summary, option=orjson.OPT_NON_STR_KEYS),
+                                 digest_size=16)
+        digest.update(arrays.timeline_scores.tobytes())
+        digest.update(arrays.timeline_severity.tobytes())
+        return digest.digest()
+    
+    def _chart_html(self, cache_key: tuple, build_chart: Callable[[], go.Figure],
+                    include_plotlyjs: Union[bool, str] = True) -> str:
+        """Return standalone chart HTML, building and serializing it only on a cache miss"""
+        html = self._html_cache.get(cache_key)
+        if html is not None:
+            self._html_cache.move_to_end(cache_key)
+            return html
+        
+        html = pio.to_html(build_chart(), include_plotlyjs=include_plotlyjs, full_html=True)
+        self._html_cache[cache_key] = html
+        if len(self._html_cache) > self.HTML_CACHE_SIZE:
+            self._html_cache.popitem(last=False)
+        return html
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Tests for the CLI's expansion of unique analyses back into prompt order
+"""
+
+from run_analysis import _stream
+
+
+def _inputs(keys):
+    prompts = [{'id': i, 'prompt': key} for i, key in enumerate(keys)]
+    prompt_keys = [p['prompt'] for p in prompts]
+    unique_keys = list(dict.fromkeys(prompt_keys))
+    return prompts, prompt_keys, unique_keys
+
+
+def test_stream_expands_repeated_and_interleaved_keys():
+    prompts, prompt_keys, unique_keys = _inputs(['a', 'b', 'a', 'c', 'b', 'a'])
+    results = [{'key': key, 'risk_score': 0} for key in unique_keys]
+
+    analyses = list(_stream(prompts, prompt_keys, unique_keys, iter(results)))
+
+    assert [a['key'] for a in analyses] == prompt_keys
+    # Every prompt gets its own dict, even when the analysis is shared
+    assert len({id(a) for a in analyses}) == len(analyses)
+    analyses[2]['id'] = 2
+    assert 'id' not in analyses[0] and 'id' not in analyses[5]
+
+
+def test_stream_pulls_results_only_as_needed():
+    prompts, prompt_keys, unique_keys = _inputs(['a', 'a', 'b', 'a', 'c'])
+    pulled = []
+
+    def results():
+        for key in unique_keys:
+            pulled.append(key)
+            yield {'key': key, 'risk_score': 0}
+
+    stream = _stream(prompts, prompt_keys, unique_keys, results())
+    assert next(stream)['key'] == 'a' and pulled == ['a']
+    assert next(stream)['key'] == 'a' and pulled == ['a']
+    assert next(stream)['key'] == 'b' and pulled == ['a', 'b']
+    assert [a['key'] for a in stream] == ['a', 'c']
+    assert pulled == unique_keys
@@ -0,0 +1,78 @@
+"""
+Tests for the batch risk scorer
+"""
+
+from pathlib import Path
+
+import orjson
+
+from src.risk_scorer import RiskScorer
+
+
+def _analysis(score, patterns=(), severity='SAFE', language='en'):
+    """Minimal analyze_prompt-shaped result for precomputed batches"""
+    return {
+        'risk_score': score,
+        'severity': severity,
+        'prompt_preview': 'preview',
+        'detected_patterns': [{'type': p} for p in patterns],
+        'unique_pattern_types': list(dict.fromkeys(patterns)),
+        'language_detected': language,
+    }
+
+
+def test_detection_accuracy_counts_each_labeled_prompt_once(tmp_path):
+    prompts = [
+        {'id': 1, 'prompt': 'a', 'known_effective': True},   # true positive
+        {'id': 2, 'prompt': 'b', 'known_effective': True},   # true positive
+        {'id': 3, 'prompt': 'c', 'known_effective': True},   # missed detection
+        {'id': 4, 'prompt': 'd', 'known_effective': False},  # false positive
+        {'id': 5, 'prompt': 'e', 'known_effective': False},  # true negative
+        {'id': 6, 'prompt': 'f'},                            # unlabeled, ignored
+    ]
+    analyses = [
+        _analysis(80, ['role_play'], 'CRITICAL'),
+        _analysis(60, ['authority'], 'HIGH'),
+        _analysis(20, [], 'LOW'),
+        _analysis(70, ['authority'], 'CRITICAL'),
+        _analysis(5, [], 'SAFE'),
+        _analysis(90, ['role_play'], 'CRITICAL'),
+    ]
+
+    results = RiskScorer(str(tmp_path)).batch_analyze(prompts, precomputed=analyses)
+
+    assert [m['id'] for m in results['missed_detections']] == [3]
+    assert [fp['id'] for fp in results['false_positives']] == [4]
+    # 2 true positives, 1 false positive, 1 miss, 5 labeled prompts
+    assert results['detection_accuracy'] == {
+        'precision': 66.7,
+        'recall': 66.7,
+        'false_positive_rate': 20.0,
+        'miss_rate': 20.0,
+    }
+
+
+def test_detection_accuracy_skipped_without_errors(tmp_path):
+    prompts = [
+        {'id': 1, 'prompt': 'a', 'known_effective': True},
+        {'id': 2, 'prompt': 'b', 'known_effective': False},
+    ]
+    analyses = [_analysis(80, ['role_play'], 'CRITICAL'), _analysis(5)]
+
+    results = RiskScorer(str(tmp_path)).batch_analyze(prompts, precomputed=analyses)
+
+    assert results['detection_accuracy'] == {}
+
+
+def test_streamed_details_are_renamed_into_place(tmp_path):
+    prompts = [{'id': 1, 'prompt': 'a'}, {'id': 2, 'prompt': 'b'}]
+    analyses = [_analysis(80, ['role_play'], 'CRITICAL'), _analysis(5)]
+
+    results = RiskScorer(str(tmp_path)).batch_analyze(prompts, precomputed=analyses,
+                                                      stream_detailed=True)
+
+    details_path = Path(results['detailed_results_path'])
+    assert results['detailed_results'] == []
+    assert [p.name for p in tmp_path.iterdir()] == [details_path.name]
+    lines = details_path.read_bytes().splitlines()
+    assert [orjson.loads(line)['original_id'] for line in lines] == [1, 2]
@@ -0,0 +1,47 @@
+"""
+Tests for the visualizer's array helpers
+"""
+
+import numpy as np
+
+from src.visualization import _downsample_lttb, _top_k
+
+
+def test_lttb_keeps_endpoints_and_threshold_increasing_indices():
+    rng = np.random.default_rng(0)
+    values = rng.random(10_000) * 100
+    indices = np.arange(len(values))
+
+    for threshold in (3, 10, 1000, 9999):
+        kept = _downsample_lttb(indices, values, threshold)
+        assert len(kept) == threshold
+        assert kept[0] == 0 and kept[-1] == len(values) - 1
+        assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_lone_spike():
+    values = np.zeros(5000)
+    values[1234] = 100.0
+    kept = _downsample_lttb(np.arange(5000), values, 50)
+    assert 1234 in kept
+
+
+def test_lttb_passes_short_series_through():
+    values = np.array([5.0, 1.0, 9.0, 3.0])
+    for threshold in (4, 10):
+        np.testing.assert_array_equal(_downsample_lttb(np.arange(4), values, threshold),
+                                      np.arange(4))
+    np.testing.assert_array_equal(_downsample_lttb([], [], 10), np.arange(0))
+
+
+def test_top_k_matches_stable_argsort_with_ties():
+    rng = np.random.default_rng(1)
+    cases = [
+        np.array([3, 1, 3, 2, 3, 1, 2]),
+        np.array([5, 5, 5, 5]),
+        rng.integers(0, 4, size=200),
+    ]
+    for values in cases:
+        expected = np.argsort(-values, kind='stable')
+        for k in (1, 2, 3, 5, len(values), len(values) + 3):
+            np.testing.assert_array_equal(_top_k(values, k), expected[:k])